@@ -1,7 +1,8 @@
 Param(
   [string]$ConfigPath = "pull_monthly/config_rg.yml",
   [string]$OutPath = $null,                 # e.g., "outputs/costs_2025-08.csv"
-  [double]$Sleep = 1.0,
+  [double]$Sleep = 0.0,
+  [int]$Concurrency = 8,
   [int]$MaxRetries = 8,
   [string]$ClientType = "tony-cost-collector",
   [string]$VenvPath = ".\.venv"             # adjust if your venv lives elsewhere
@@ -47,7 +48,7 @@ if (-not (Test-Path $scriptPath)) {
 }
 
 # Build args
-$pyArgs = @("--config", $ConfigPath, "--sleep", $Sleep, "--maxretries", $MaxRetries, "--clienttype", $ClientType)
+$pyArgs = @("--config", $ConfigPath, "--sleep", $Sleep, "--concurrency", $Concurrency, "--maxretries", $MaxRetries, "--clienttype", $ClientType)
 if ($OutPath) { $pyArgs += @("--out", $OutPath) }
 
 python $scriptPath @pyArgs
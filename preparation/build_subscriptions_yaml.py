@@ -1,7 +1,11 @@
 import argparse
+import base64
 import csv
+import json
 import re
 import sys
+import threading
+import time
 from collections import defaultdict
 from typing import Dict, Iterable, Tuple, Optional
 from pathlib import Path
@@ -13,6 +17,8 @@ from azure.identity import (
     AzureCliCredential,
     VisualStudioCodeCredential,
     InteractiveBrowserCredential,
+    TokenCachePersistenceOptions,
+    AuthenticationRecord,
 )
 from azure.mgmt.resource import SubscriptionClient
 
@@ -24,17 +30,72 @@ GUID_RE = re.compile(
     r"[0-9a-fA-F]{12}$"
 )
 
+# use libyaml when available
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
 HEADERS_CANDIDATES = [
     ("subscription", "resource_group")
 ]
 
+SUBS_CACHE_DIR = Path.home() / ".cache" / "az_cost"
+SUBS_CACHE_TTL_SECONDS = 24 * 60 * 60
+ARM_SCOPE = "https://management.azure.com/.default"
+
+
+class LazyInteractiveCredential:
+    """
+    Browser sign-in that is only set up when a token is actually requested, i.e.
+    after the CLI/VS Code credentials ahead of it in the chain have failed. The
+    first sign-in saves an AuthenticationRecord; later runs pass it back so tokens
+    come from the on-disk MSAL cache without opening the browser.
+    """
 
-def get_credential(tenant_id: Optional[str]) -> ChainedTokenCredential:
+    def __init__(self, tenant_id: Optional[str]):
+        self.tenant_id = tenant_id
+        self.record_path = SUBS_CACHE_DIR / f"auth_record_{tenant_id or 'default'}.json"
+        self._credential: Optional[InteractiveBrowserCredential] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self, scopes: Tuple[str, ...]) -> InteractiveBrowserCredential:
+        with self._lock:
+            if self._credential is not None:
+                return self._credential
+            options = TokenCachePersistenceOptions(name="cost-collector", allow_unencrypted_storage=True)
+            try:
+                record = AuthenticationRecord.deserialize(self.record_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError, KeyError):
+                record = None  # no earlier sign-in saved
+
+            credential = InteractiveBrowserCredential(
+                tenant_id=self.tenant_id,
+                cache_persistence_options=options,
+                authentication_record=record,
+            )
+            if record is None:
+                record = credential.authenticate(scopes=list(scopes))
+                try:
+                    self.record_path.parent.mkdir(parents=True, exist_ok=True)
+                    self.record_path.write_text(record.serialize(), encoding="utf-8")
+                except OSError as e:
+                    print(f"Warning: could not save authentication record {self.record_path}: {e}", file=sys.stderr)
+            self._credential = credential
+            return credential
+
+    def get_token(self, *scopes: str, **kwargs):
+        return self._ensure(scopes).get_token(*scopes, **kwargs)
+
+    def close(self) -> None:
+        if self._credential is not None:
+            self._credential.close()
+
+
+def get_credential(tenant_id: Optional[str], interactive: bool = False) -> ChainedTokenCredential:
     """
     Prefer your signed-in user:
       1) Azure CLI (az login)
       2) VS Code Azure Account extension
-      3) Interactive browser fallback
+      3) Interactive browser fallback (only with interactive=True; see LazyInteractiveCredential)
     """
     creds = []
     try:
@@ -47,7 +108,8 @@ def get_credential(tenant_id: Optional[str]) -> ChainedTokenCredential:
     except Exception:
         pass  # extension not available; continue
 
-    creds.append(InteractiveBrowserCredential(tenant_id=tenant_id))
+    if interactive:
+        creds.append(LazyInteractiveCredential(tenant_id))
     return ChainedTokenCredential(*creds)
 
 
@@ -56,8 +118,9 @@ def detect_headers(fieldnames: Iterable[str]) -> Tuple[str, str]:
     fields = [f for f in (fieldnames or []) if f]
     lower_map = {f.strip().lower(): f for f in fields}
     for sub_col, rg_col in HEADERS_CANDIDATES:
-        if sub_col in lower_map and rg_col in lower_map:
-            return lower_map[sub_col], lower_map[rg_col]
+        got = (lower_map.get(sub_col), lower_map.get(rg_col))
+        if all(got):
+            return got
     raise ValueError(
         f"Could not detect CSV headers. Found columns: {fieldnames}\n"
         f"Expected something like: subscription,resource_group"
@@ -66,23 +129,84 @@ def detect_headers(fieldnames: Iterable[str]) -> Tuple[str, str]:
 
 def load_rows(path: str) -> Iterable[Tuple[str, str]]:
     with open(path, newline="", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
-        sub_col, rg_col = detect_headers(reader.fieldnames or [])
+        # Positional reader with pre-resolved column indices; no per-row dict
+        reader = csv.reader(f)
+        header = next(reader, [])
+        sub_col, rg_col = detect_headers(header)
+        sub_i, rg_i = header.index(sub_col), header.index(rg_col)
+        min_len = max(sub_i, rg_i) + 1
         for row in reader:
-            sub_raw = (row.get(sub_col) or "").strip()
-            rg = (row.get(rg_col) or "").strip()
+            if len(row) < min_len:
+                continue
+            sub_raw = row[sub_i].strip()
+            rg = row[rg_i].strip()
             if not sub_raw or not rg:
                 # Skip blank or partial rows
                 continue
             yield sub_raw, rg
 
 
-def build_subscription_index(credential, tenant_id: Optional[str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+def _identity_key(credential, tenant_id: Optional[str]) -> Optional[str]:
+    """
+    Return "<tid>_<oid>" from the claims of an ARM access token, so the cache
+    follows whoever is actually signed in (az login can switch account/tenant).
+    Returns None when the claims can't be read; the cache is skipped then.
+    """
+    try:
+        token = credential.get_token(ARM_SCOPE, tenant_id=tenant_id) if tenant_id else credential.get_token(ARM_SCOPE)
+        payload = token.token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return f"{claims['tid']}_{claims['oid']}"
+    except Exception:
+        return None  # auth problems surface again (with detail) from SubscriptionClient
+
+
+def _subs_cache_path(identity_key: str) -> Path:
+    return SUBS_CACHE_DIR / f"subs_{identity_key}.json"
+
+
+def _load_cached_index(identity_key: str) -> Optional[Tuple[Dict[str, str], Dict[str, str]]]:
+    """Return (name_to_id, id_to_name) from disk if the cache is younger than the TTL."""
+    path = _subs_cache_path(identity_key)
+    try:
+        if time.time() - path.stat().st_mtime > SUBS_CACHE_TTL_SECONDS:
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return data["name_to_id"], data["id_to_name"]
+    except (OSError, ValueError, KeyError):
+        return None  # missing, stale or unreadable; fetch from Azure instead
+
+
+def _save_cached_index(identity_key: str, name_to_id: Dict[str, str], id_to_name: Dict[str, str]) -> None:
+    path = _subs_cache_path(identity_key)
+    # write-then-rename so a crash never leaves a truncated cache file behind
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"name_to_id": name_to_id, "id_to_name": id_to_name}, f)
+        tmp_path.replace(path)
+    except OSError as e:
+        print(f"Warning: could not write subscription cache {path}: {e}", file=sys.stderr)
+
+
+def build_subscription_index(credential, tenant_id: Optional[str],
+                             refresh: bool = False) -> Tuple[Dict[str, str], Dict[str, str]]:
     """
     Returns:
-      - name_to_id: case-insensitive display name -> subscription_id
+      - name_to_id: casefolded display name -> subscription_id
       - id_to_name: subscription_id -> display name
+
+    Results are cached per signed-in tenant/user under ~/.cache/az_cost for 24h;
+    pass refresh=True to bypass.
     """
+    identity_key = _identity_key(credential, tenant_id)
+    if identity_key is not None and not refresh:
+        cached = _load_cached_index(identity_key)
+        if cached is not None:
+            return cached
+
     client = SubscriptionClient(credential)
     name_to_id: Dict[str, str] = {}
     id_to_name: Dict[str, str] = {}
@@ -99,7 +223,7 @@ def build_subscription_index(credential, tenant_id: Optional[str]) -> Tuple[Dict
         if not sid:
             continue
         id_to_name[sid] = display
-        key = display.lower()
+        key = display.casefold()
         if key in seen_names:
             # Warn once per duplicate name; still keep the first seen.
             print(f"Warning: duplicate subscription display name detected: '{display}'. "
@@ -109,20 +233,27 @@ def build_subscription_index(credential, tenant_id: Optional[str]) -> Tuple[Dict
             if key not in name_to_id:
                 name_to_id[key] = sid
 
+    if subs and identity_key is not None:
+        _save_cached_index(identity_key, name_to_id, id_to_name)
     return name_to_id, id_to_name
 
 
+def is_guid(value: str) -> bool:
+    """Cheap length check first; only 36-char strings go through the regex."""
+    return len(value) == 36 and GUID_RE.match(value) is not None
+
+
 def resolve_subscription_id(
     sub_input: str,
     name_to_id: Dict[str, str],
     id_to_name: Dict[str, str]
 ) -> Optional[str]:
     # If input looks like a GUID, pass through (whether or not we can see it)
-    if GUID_RE.match(sub_input):
+    if is_guid(sub_input):
         return sub_input
 
     # Otherwise treat as a display name (case-insensitive)
-    key = sub_input.lower()
+    key = sub_input.casefold()
     sid = name_to_id.get(key)
     if not sid:
         print(
@@ -175,34 +306,42 @@ def main():
     parser.add_argument("--output-dir", help="Directory to write YAML (created if missing). Defaults to CWD.")
     parser.add_argument("--output-name", help="Basename for the YAML file (e.g., output.yml). Defaults to subscriptions.yml.")
     parser.add_argument("--tenant-id", help="Optional Tenant ID if you need to force a specific tenant for auth")
+    parser.add_argument("--interactive", action="store_true",
+                        help="Fall back to interactive browser sign-in if CLI/VS Code auth fails")
+    parser.add_argument("--refresh-subs", action="store_true",
+                        help="Ignore the cached subscription list (~/.cache/az_cost) and re-fetch from Azure")
+    parser.add_argument("--quiet", "-q", action="store_true", help="Do not echo the generated YAML to stdout")
     args = parser.parse_args()
 
+    # group RGs by the raw subscription value first, consuming CSV rows one at a time
+    raw_agg: Dict[str, set] = defaultdict(set)
     try:
-        rows = list(load_rows(args.input))
+        for sub_raw, rg in load_rows(args.input):
+            raw_agg[sub_raw].add(rg)
     except Exception as e:
         print(f"Error reading CSV: {e}", file=sys.stderr)
         sys.exit(2)
 
-    if not rows:
+    if not raw_agg:
         print("No valid rows found in the CSV. Nothing to do.", file=sys.stderr)
         sys.exit(1)
 
-    credential = get_credential(args.tenant_id)
-    name_to_id, id_to_name = build_subscription_index(credential, args.tenant_id)
+    credential = get_credential(args.tenant_id, args.interactive)
+    name_to_id, id_to_name = build_subscription_index(credential, args.tenant_id, args.refresh_subs)
 
-    # aggregate
+    # resolve each distinct subscription once
     agg_rgs: Dict[str, set] = defaultdict(set)
     agg_name: Dict[str, str] = {}
 
-    for sub_raw, rg in rows:
+    for sub_raw, rgs in raw_agg.items():
         sid = resolve_subscription_id(sub_raw, name_to_id, id_to_name)
         if not sid:
             continue
-        agg_rgs[sid].add(rg)
+        agg_rgs[sid].update(rgs)
 
         # prefer Azure’s display name; otherwise use CSV’s display name when not a GUID
         chosen_name = id_to_name.get(sid)
-        if not chosen_name and not GUID_RE.match(sub_raw):
+        if not chosen_name and not is_guid(sub_raw):
             chosen_name = sub_raw.strip()
         if chosen_name:
             agg_name.setdefault(sid, chosen_name)
@@ -215,19 +354,21 @@ def main():
     out_doc = {
         "subscriptions": [
             {"id": sid, "name": agg_name.get(sid, id_to_name.get(sid, "")),
-            "resource_groups": sorted(list(rgs))}
-            for sid, rgs in sorted(agg_rgs.items(), key=lambda kv: kv[0].lower())
+            "resource_groups": sorted(agg_rgs[sid])}
+            for sid in sorted(agg_rgs, key=str.lower)
         ]
     }
 
     out_path = resolve_output_path(args)
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        yaml.safe_dump(out_doc, f, sort_keys=False)
+    # Serialize once; the same text goes to the file and (optionally) stdout
+    text = yaml.dump(out_doc, Dumper=YAML_DUMPER, sort_keys=False)
+    out_path.write_text(text, encoding="utf-8")
 
     print(f"Wrote {out_path}")
-    # Also echo to stdout for convenience
-    print(yaml.safe_dump(out_doc, sort_keys=False))
+    if not args.quiet:
+        # Also echo to stdout for convenience
+        print(text)
 
 
 if __name__ == "__main__":
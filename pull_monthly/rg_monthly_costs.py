@@ -2,16 +2,25 @@
 import argparse
 import csv
 import datetime as dt
+import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import yaml
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.costmanagement import CostManagementClient
-from azure.identity import DefaultAzureCredential, AzureCliCredential, ChainedTokenCredential, InteractiveBrowserCredential
+from azure.identity import DefaultAzureCredential, AzureCliCredential, ChainedTokenCredential, InteractiveBrowserCredential, TokenCachePersistenceOptions, AuthenticationRecord
 
 import time, random
+from collections import defaultdict, deque
+from email.utils import parsedate_to_datetime
 from azure.core.exceptions import HttpResponseError
+from azure.core.rest import HttpRequest
+
+# use libyaml when available
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 RETRY_AFTER_KEYS = [
     "Retry-After",
@@ -22,54 +31,168 @@ RETRY_AFTER_KEYS = [
     "x-ms-ratelimit-microsoft.consumption-retry-after",
 ]
 
+ISO_UTC_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# The interactive credential only reads the persisted MSAL cache silently when it
+# is given the AuthenticationRecord saved from an earlier sign-in
+AUTH_RECORD_PATH = Path.home() / ".cache" / "az_cost" / "auth_record_default.json"
+
+# Per-subscription results for closed months are cached here. Usage can arrive up
+# to ~72h late and be re-rated afterwards, so a period is only cached (and a cache
+# entry only trusted) when it was fetched at least this long after the period ended
+COST_CACHE_DIR = Path.home() / ".cache" / "az_cost"
+COST_CACHE_SETTLE = dt.timedelta(days=5)
+
 # ---------- helpers ----------
 def _parse_retry_after(headers: dict) -> float | None:
     for k in RETRY_AFTER_KEYS:
         v = headers.get(k)
         if not v:
             continue
-        # header can be "seconds" or an HTTP date; treat as seconds if int
+        # header can be "seconds" or an HTTP date (RFC 7231)
         try:
-            return float(v)
-        except Exception:
-            # if HTTP-date, fall back to a conservative default below
-            return None
+            return max(0.0, float(v))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(v)
+        except (TypeError, ValueError):
+            continue  # unparseable; try the next header
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=dt.timezone.utc)
+        return max(0.0, (when - dt.datetime.now(dt.timezone.utc)).total_seconds())
     return None
 
+class RateLimiter:
+    """
+    Process-wide token bucket shared by all worker threads.
+    acquire() blocks until a request slot is free; penalize() holds every thread
+    off for a cooldown (e.g. after a 429) so workers don't stampede the API.
+    """
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                else:
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
 def usage_with_retry(cm_client, scope: str, parameters: dict,
                      client_type: str = "tony-cost-collector",
-                     max_retries: int = 8, base_sleep: float = 2.0):
+                     max_retries: int = 8, base_sleep: float = 2.0,
+                     max_sleep: float = 60.0, limiter: RateLimiter | None = None,
+                     next_link: str | None = None):
     """
     Call CostManagement query.usage() with adaptive backoff honoring Retry-After headers.
+    Without a header, sleeps use decorrelated jitter: min(max_sleep, uniform(base, prev * 3)).
+    If a shared limiter is given, every attempt takes a token and throttling pauses all threads.
+    With next_link, fetches that follow-up page instead (returned as the raw JSON dict).
     """
     headers = {"x-ms-command-name": "CostAnalysis", "ClientType": client_type}
     attempt = 0
+    prev_sleep = base_sleep
     while True:
+        if limiter is not None:
+            limiter.acquire()
         try:
+            if next_link:
+                # query.usage() has no paging support; POST the same body to the nextLink URL
+                response = cm_client._send_request(HttpRequest("POST", next_link, json=parameters, headers=headers))
+                response.raise_for_status()
+                return response.json()
             # many Azure SDK ops accept per-call headers via kwargs
             return cm_client.query.usage(scope=scope, parameters=parameters, headers=headers)
         except HttpResponseError as e:
             if e.status_code in (429, 503):
-                headers_map = dict(getattr(e.response, "headers", {}))
-                retry_after = _parse_retry_after(headers_map)
-                if retry_after is None:
-                    # exponential backoff with jitter, capped
-                    retry_after = min(base_sleep * (2 ** attempt), 60.0)
-                # small jitter to de-synchronize
-                jitter = random.uniform(0, 0.2 * retry_after)
-                sleep_s = retry_after + jitter
-                time.sleep(sleep_s)
                 attempt += 1
                 if attempt >= max_retries:
                     raise
+                headers_map = dict(getattr(e.response, "headers", {}) or {})
+                retry_after = _parse_retry_after(headers_map)
+                if retry_after is None:
+                    sleep_s = min(max_sleep, random.uniform(base_sleep, prev_sleep * 3))
+                else:
+                    # server-specified wait plus a small jitter to de-synchronize clients
+                    sleep_s = retry_after + random.uniform(0, min(1.0, 0.1 * retry_after))
+                prev_sleep = max(base_sleep, sleep_s)
+                if limiter is not None:
+                    limiter.penalize(sleep_s)
+                time.sleep(sleep_s)
             else:
                 raise
 
-def build_credential():
-    # Prefer CLI (works great after `az login`), then fall back to interactive browser
+class LazyInteractiveCredential:
+    """
+    Browser sign-in that is only set up when a token is actually requested, i.e.
+    after the credentials ahead of it in a chain have failed. The first sign-in
+    saves an AuthenticationRecord; later runs pass it back so tokens come from the
+    on-disk MSAL cache without opening the browser.
+    """
+    def __init__(self, record_path: Path, tenant_id: str | None = None):
+        self.record_path = record_path
+        self.tenant_id = tenant_id
+        self._credential = None
+        self._lock = threading.Lock()
+
+    def _ensure(self, scopes: tuple) -> InteractiveBrowserCredential:
+        with self._lock:
+            if self._credential is not None:
+                return self._credential
+            options = TokenCachePersistenceOptions(name="cost-collector", allow_unencrypted_storage=True)
+            try:
+                record = AuthenticationRecord.deserialize(self.record_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError, KeyError):
+                record = None  # no earlier sign-in saved
+            credential = InteractiveBrowserCredential(
+                tenant_id=self.tenant_id,
+                cache_persistence_options=options,
+                authentication_record=record,
+            )
+            if record is None:
+                # First use: sign in via the browser once and save the record for later processes
+                record = credential.authenticate(scopes=list(scopes))
+                try:
+                    self.record_path.parent.mkdir(parents=True, exist_ok=True)
+                    self.record_path.write_text(record.serialize(), encoding="utf-8")
+                except OSError as e:
+                    print(f"Warning: could not save authentication record {self.record_path}: {e}", file=sys.stderr)
+            self._credential = credential
+            return credential
+
+    def get_token(self, *scopes: str, **kwargs):
+        return self._ensure(scopes).get_token(*scopes, **kwargs)
+
+    def close(self) -> None:
+        if self._credential is not None:
+            self._credential.close()
+
+def build_credential(interactive: bool = False):
+    # Azure CLI only by default (works great after `az login`); with --interactive
+    # the browser is used only if the CLI credential fails
+    if not interactive:
+        return AzureCliCredential()
     return ChainedTokenCredential(
         AzureCliCredential(),
-        InteractiveBrowserCredential()  # opens a browser on first run
+        LazyInteractiveCredential(AUTH_RECORD_PATH),
     )
 
 def previous_month_range(now_utc: dt.datetime) -> tuple[str, str]:
@@ -81,21 +204,54 @@ def previous_month_range(now_utc: dt.datetime) -> tuple[str, str]:
     """
     first_of_this_month = now_utc.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     prev_month_end = first_of_this_month - dt.timedelta(seconds=1)
-    first_of_prev_month = prev_month_end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    return first_of_prev_month.isoformat() + "Z", prev_month_end.isoformat() + "Z"
+    first_of_prev_month = prev_month_end.replace(day=1, hour=0, minute=0, second=0)
+    return first_of_prev_month.strftime(ISO_UTC_FORMAT), prev_month_end.strftime(ISO_UTC_FORMAT)
 
 def load_config(path: Path) -> dict:
     with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+        cfg = yaml.load(f, Loader=YAML_LOADER) or {}
+    # Normalize wanted RG names once at load time (lowercased, de-duplicated)
+    for sub in cfg.get("subscriptions", []) or []:
+        sub["_wanted_rgs"] = frozenset(rg.lower() for rg in sub.get("resource_groups", []) or [])
+    return cfg
+
+def _period_is_settled(end_iso: str, at: dt.datetime | None = None) -> bool:
+    end = dt.datetime.strptime(end_iso, ISO_UTC_FORMAT).replace(tzinfo=dt.timezone.utc)
+    return (at or dt.datetime.now(dt.timezone.utc)) - end > COST_CACHE_SETTLE
+
+def _load_cached_costs(path: Path, end_iso: str) -> dict | None:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        fetched_at = dt.datetime.strptime(data["fetched_at"], ISO_UTC_FORMAT).replace(tzinfo=dt.timezone.utc)
+        costs = data["costs"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None  # missing, unreadable or old format; query Azure instead
+    if not costs or not _period_is_settled(end_iso, fetched_at):
+        return None  # fetched before the data settled (or empty); don't trust it
+    return costs
+
+def _save_cached_costs(path: Path, rg_costs: dict) -> None:
+    if not rg_costs:
+        return  # an empty result is more likely missing data than a genuine all-zero month
+    # write-then-rename so a crash never leaves a truncated cache file behind
+    tmp_path = path.with_name(path.name + ".tmp")
+    data = {
+        "fetched_at": dt.datetime.now(dt.timezone.utc).strftime(ISO_UTC_FORMAT),
+        "costs": rg_costs,
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp_path.replace(path)
+    except OSError as e:
+        print(f"Warning: could not write cost cache {path}: {e}", file=sys.stderr)
 
 # ---------- core ----------
-def query_rg_costs_for_subscription(cm_client: CostManagementClient, subscription_id: str, start_iso: str, end_iso: str, max_retries: int, client_type: str) -> dict:
-    """
-    Returns a dict: { rg_name_lower: total_cost_float }
-    """
-    scope = f"/subscriptions/{subscription_id}"
-    # Group by ResourceGroupName; aggregate PreTaxCost (common measure for total cost)
-    parameters = {
+def _usage_parameters(start_iso: str, end_iso: str, group_by: list[str]) -> dict:
+    # Group by the given dimensions; aggregate PreTaxCost (common measure for total cost)
+    return {
         "type": "Usage",
         "timeframe": "Custom",
         "timePeriod": {"from": start_iso, "to": end_iso},  # end is exclusive
@@ -104,44 +260,123 @@ def query_rg_costs_for_subscription(cm_client: CostManagementClient, subscriptio
             "aggregation": {
                 "totalCost": {"name": "PreTaxCost", "function": "Sum"}
             },
-            "grouping": [
-                {"type": "Dimension", "name": "ResourceGroupName"}
-            ]
+            "grouping": [{"type": "Dimension", "name": name} for name in group_by]
         }
     }
 
-    resp = usage_with_retry(cm_client, scope, parameters, client_type, max_retries)
-    rows = getattr(resp, "rows", []) or getattr(resp, "properties", {}).get("rows", [])
-    cols = getattr(resp, "columns", []) or getattr(resp, "properties", {}).get("columns", [])
+def _page_parts(resp) -> tuple[list, dict, str | None]:
+    # SDK QueryResult for the first page, raw JSON dict for follow-up pages
+    props = resp.get("properties") or {} if isinstance(resp, dict) else getattr(resp, "properties", None) or {}
+    rows = getattr(resp, "rows", None) or props.get("rows") or []
+    cols = getattr(resp, "columns", None) or props.get("columns") or []
+    next_link = getattr(resp, "next_link", None) or props.get("nextLink")
+    # map column name -> index in a single pass over the columns
+    col_idx = {(getattr(c, "name", None) or c.get("name")): i for i, c in enumerate(cols)}
+    return rows, col_idx, next_link
 
-    # find indices
-    try:
-        rg_idx = next(i for i, c in enumerate(cols) if (getattr(c, "name", None) or c.get("name")) in ("ResourceGroupName", "ResourceGroup"))
-    except StopIteration:
-        raise RuntimeError("Query did not return ResourceGroupName column; check permissions/scope.")
-    try:
-        cost_idx = next(i for i, c in enumerate(cols) if (getattr(c, "name", None) or c.get("name")) in ("totalCost", "PreTaxCost"))
-    except StopIteration:
+def _usage_pages(cm_client, scope: str, parameters: dict, client_type: str, max_retries: int,
+                 limiter: RateLimiter | None = None):
+    """Yield (rows, col_idx) for every page of a usage query, following nextLink."""
+    next_link = None
+    seen = set()
+    while True:
+        resp = usage_with_retry(cm_client, scope, parameters, client_type, max_retries,
+                                limiter=limiter, next_link=next_link)
+        rows, col_idx, next_link = _page_parts(resp)
+        yield rows, col_idx
+        if not next_link:
+            return
+        if next_link in seen:
+            raise RuntimeError("Query paging returned a repeated nextLink; refusing to loop.")
+        seen.add(next_link)
+
+def _find_column(col_idx: dict, names: tuple[str, ...], error: str) -> int:
+    idx = next((col_idx[n] for n in names if n in col_idx), None)
+    if idx is None:
+        raise RuntimeError(error)
+    return idx
+
+def query_rg_costs_for_subscription(cm_client: CostManagementClient, scope: str, start_iso: str, end_iso: str, max_retries: int, client_type: str, limiter: RateLimiter | None = None) -> dict:
+    """
+    scope is the subscription scope string, e.g. "/subscriptions/<id>".
+    Returns a dict: { rg_name_lower: total_cost_float }
+    """
+    parameters = _usage_parameters(start_iso, end_iso, ["ResourceGroupName"])
+
+    out = defaultdict(float)
+    to_float = float
+    for rows, col_idx in _usage_pages(cm_client, scope, parameters, client_type, max_retries, limiter):
+        rg_idx = _find_column(col_idx, ("ResourceGroupName", "ResourceGroup"),
+                              "Query did not return ResourceGroupName column; check permissions/scope.")
         # Some SDKs set the column name to the aggregation key ("totalCost")
-        try:
-            cost_idx = next(i for i, c in enumerate(cols) if (getattr(c, "name", None) or c.get("name")) == "totalCost")
-        except StopIteration:
-            raise RuntimeError("Query did not return cost column; check aggregation name.")
-
-    out = {}
-    for r in rows:
-        rg = r[rg_idx] or ""
-        cost = float(r[cost_idx] or 0.0)
-        out[rg.lower()] = out.get(rg.lower(), 0.0) + cost
+        cost_idx = _find_column(col_idx, ("totalCost", "PreTaxCost"),
+                                "Query did not return cost column; check aggregation name.")
+        for r in rows:
+            rg = r[rg_idx]
+            if not rg:
+                continue
+            cost = to_float(r[cost_idx] or 0.0)
+            if cost == 0.0:
+                continue  # adds nothing; missing RGs already default to 0.0 on output
+            out[rg.lower()] += cost
+    return out
+
+def query_rg_costs_for_scope(cm_client: CostManagementClient, scope: str, start_iso: str, end_iso: str, max_retries: int, client_type: str, limiter: RateLimiter | None = None) -> dict:
+    """
+    Query a scope spanning many subscriptions (management group, billing account) in one call.
+    Returns a dict: { subscription_id_lower: { rg_name_lower: total_cost_float } }
+    """
+    parameters = _usage_parameters(start_iso, end_iso, ["SubscriptionId", "ResourceGroupName"])
+
+    out = defaultdict(lambda: defaultdict(float))
+    to_float = float
+    for rows, col_idx in _usage_pages(cm_client, scope, parameters, client_type, max_retries, limiter):
+        sub_idx = _find_column(col_idx, ("SubscriptionId",),
+                               "Query did not return SubscriptionId column; check permissions/scope.")
+        rg_idx = _find_column(col_idx, ("ResourceGroupName", "ResourceGroup"),
+                              "Query did not return ResourceGroupName column; check permissions/scope.")
+        cost_idx = _find_column(col_idx, ("totalCost", "PreTaxCost"),
+                                "Query did not return cost column; check aggregation name.")
+        for r in rows:
+            # touch the subscription first so it counts as covered even if all its rows are skipped
+            sub_key = (r[sub_idx] or "").lower()
+            sub_costs = out[sub_key]
+            rg = r[rg_idx]
+            if not rg:
+                continue
+            cost = to_float(r[cost_idx] or 0.0)
+            if cost == 0.0:
+                continue  # adds nothing; missing RGs already default to 0.0 on output
+            sub_costs[rg.lower()] += cost
     return out
 
+def _bounded_map(executor: ThreadPoolExecutor, fn, items, window: int):
+    """
+    Like executor.map(), yielding results in input order, but with at most `window`
+    futures in flight so finished results don't pile up behind a slow one.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
 def main():
     ap = argparse.ArgumentParser(description="Pull last month's Azure cost per Resource Group.")
     ap.add_argument("--config", required=True, help="Path to config.yml")
     ap.add_argument("--out", default=None, help="Output CSV path (default: ./outputs/costs_<YYYY-MM>.csv)")
-    ap.add_argument("--sleep", type=float, default=1.0, help="Seconds to sleep between subscriptions")
+    ap.add_argument("--sleep", type=float, default=0.0, help="Optional seconds each worker pauses after a subscription")
+    ap.add_argument("--concurrency", type=int, default=8, help="Number of subscriptions to query in parallel")
     ap.add_argument("--maxretries", type=int, default=8, help="Max retries on 429/503")
+    ap.add_argument("--rate", type=float, default=10.0, help="Max Cost Management requests per second across all workers (0 = unlimited)")
     ap.add_argument("--clienttype", default="tony-cost-collector", help="ClientType header value")
+    ap.add_argument("--interactive", action="store_true", help="Fall back to interactive browser sign-in if Azure CLI auth fails")
+    ap.add_argument("--mg-scope", default=None,
+                    help="Query all subscriptions in one call at this scope, e.g. /providers/Microsoft.Management/managementGroups/<id>")
+    ap.add_argument("--refresh-costs", "--no-cache", dest="refresh_costs", action="store_true",
+                    help="Re-query Azure instead of reusing cached results for closed months; fresh results replace the cache")
     ap.add_argument("--month", type=str, default=None, help="Month to pull in YYYY-MM format (default: previous month)")
     args = ap.parse_args()
 
@@ -161,60 +396,107 @@ def main():
             else:
                 first_of_next_month = dt.datetime(year, month + 1, 1, 0, 0, 0)
             end_of_month = first_of_next_month - dt.timedelta(seconds=1)
-            start_iso = first_of_month.isoformat() + "Z"
-            end_iso = end_of_month.isoformat() + "Z"
+            start_iso = first_of_month.strftime(ISO_UTC_FORMAT)
+            end_iso = end_of_month.strftime(ISO_UTC_FORMAT)
             month_label = args.month
         except Exception as e:
             print(f"Invalid --month format: {args.month}. Use YYYY-MM.", file=sys.stderr)
             sys.exit(3)
     else:
-        now_utc = dt.datetime.utcnow()
+        now_utc = dt.datetime.now(dt.timezone.utc)
         start_iso, end_iso = previous_month_range(now_utc)
         month_label = start_iso[:7]  # YYYY-MM
 
     out_path = Path(args.out) if args.out else Path("./outputs") / f"costs_{month_label}.csv"
 
-    credential = build_credential()
-    cm_client = CostManagementClient(credential=credential)
+    credential = build_credential(args.interactive)
+    # SDK clients are not guaranteed thread-safe, so each worker thread gets its own
+    local = threading.local()
+    limiter = RateLimiter(args.rate) if args.rate > 0 else None
 
-    records = []
-    for sub in targets:
-        sub_id = sub["id"]
-        sub_name = sub.get("name") or sub.get("display_name") or sub_id
-        wanted_rgs = [rg.lower() for rg in sub.get("resource_groups", [])]
-        rg_costs = query_rg_costs_for_subscription(cm_client, sub_id, start_iso, end_iso, args.maxretries, args.clienttype)
+    def _client() -> CostManagementClient:
+        cm_client = getattr(local, "cm_client", None)
+        if cm_client is None:
+            cm_client = local.cm_client = CostManagementClient(credential=credential)
+        return cm_client
 
+    # Resolve everything a worker needs up front: (scope, wanted_rgs, sub_id, sub_name)
+    work_items = [
+        (f"/subscriptions/{sub['id']}", sub["_wanted_rgs"], sub["id"],
+         sub.get("name") or sub.get("display_name") or sub["id"])
+        for sub in targets
+    ]
+
+    def _rows(item: tuple, rg_costs: dict):
+        _, wanted_rgs, sub_id, sub_name = item
         # Emit requested RGs only; include zeros if not present
-        for rg in wanted_rgs:
-            cost = rg_costs.get(rg, 0.0)
-            records.append({
-                "subscription_id": sub_id,
-                "subscription_name": sub_name,
-                "resource_group": rg,
-                "start": start_iso,
-                "end": end_iso,
-                "total_cost": round(cost, 2)
-            })
-        time.sleep(args.sleep) # Pacing to not overload Azure
-
-    # Write CSV
+        for rg in sorted(wanted_rgs):
+            yield (sub_id, sub_name, rg, start_iso, end_iso, round(rg_costs.get(rg, 0.0), 2))
+
+    use_cache = _period_is_settled(end_iso)
+
+    def _work(item: tuple) -> tuple[tuple, dict]:
+        cache_path = COST_CACHE_DIR / f"{item[2]}_{start_iso[:7]}.json" if use_cache else None
+        if cache_path is not None and not args.refresh_costs:
+            rg_costs = _load_cached_costs(cache_path, end_iso)
+            if rg_costs is not None:
+                return item, rg_costs
+
+        rg_costs = query_rg_costs_for_subscription(_client(), item[0], start_iso, end_iso, args.maxretries, args.clienttype, limiter)
+        if cache_path is not None:
+            _save_cached_costs(cache_path, rg_costs)
+        if args.sleep > 0:
+            time.sleep(args.sleep)
+        return item, rg_costs
+
+    # Stream rows to a temp file as each subscription completes; only replace the
+    # real output once every query has succeeded
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    with out_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    row_count = 0
+    try:
+        with tmp_path.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow((
                 "subscription_id",
                 "subscription_name",
                 "resource_group",
                 "start",
                 "end",
                 "total_cost",
-            ],
-        )
-        writer.writeheader()
-        writer.writerows(records)
+            ))
+            if args.mg_scope:
+                # One query for every subscription under the scope, then fan back out per subscription
+                costs_by_sub = query_rg_costs_for_scope(_client(), args.mg_scope, start_iso, end_iso, args.maxretries, args.clienttype, limiter)
+                missing = [item[2] for item in work_items if item[2].lower() not in costs_by_sub]
+                if missing:
+                    # Not necessarily $0: the sub may be outside the scope or lack Cost Management Reader there
+                    print(f"Warning: no cost data returned at {args.mg_scope} for {len(missing)} configured "
+                          f"subscription(s); their rows will show 0.00. Check they are under this scope: "
+                          f"{', '.join(missing)}", file=sys.stderr)
+                results = ((item, costs_by_sub.get(item[2].lower(), {})) for item in work_items)
+                executor = None
+            else:
+                # I/O-bound: run subscriptions in parallel; pacing is left to usage_with_retry's backoff.
+                # Results come back in config order, so rows are written from this thread only (no lock
+                # needed); the in-flight window bounds how many finished results can be held at once.
+                workers = max(1, args.concurrency)
+                executor = ThreadPoolExecutor(max_workers=workers)
+                results = _bounded_map(executor, _work, work_items, 2 * workers)
+            try:
+                for item, rg_costs in results:
+                    for row in _rows(item, rg_costs):
+                        writer.writerow(row)
+                        row_count += 1
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+        tmp_path.replace(out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)  # don't leave a partial report behind
+        raise
 
-    print(f"Wrote {len(records)} rows to {out_path}")
+    print(f"Wrote {row_count} rows to {out_path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file